@@ -2,16 +2,25 @@ import re
 from pathlib import Path
 import argparse
 
-parser = argparse.ArgumentParser(description="Convert glossary markdown format.")
-parser.add_argument("glossary_path", nargs="?", default="src/appendix/glossary.md",
-                    help="Path to the glossary markdown file (default: src/appendix/glossary.md)")
-args = parser.parse_args()
+PATTERN = re.compile(r'^\*\*(.+?)\*\*\r?\n: (.+)$', re.MULTILINE)
 
-p = Path(args.glossary_path)
-text = p.read_text(encoding='utf-8')
 
-pattern = re.compile(r'^\*\*(.+?)\*\*\r?\n: (.+)$', re.MULTILINE)
-new_text, n = pattern.subn(r'## \1\n\2', text)
+def main():
+    parser = argparse.ArgumentParser(description="Convert glossary markdown format.")
+    parser.add_argument("glossary_path", nargs="?", default="src/appendix/glossary.md",
+                        help="Path to the glossary markdown file (default: src/appendix/glossary.md)")
+    args = parser.parse_args()
 
-print(f'Converted {n} terms.')
-p.write_text(new_text, encoding='utf-8')
+    p = Path(args.glossary_path)
+    text = p.read_text(encoding='utf-8')
+
+    new_text, n = PATTERN.subn(r'## \1\n\2', text)
+
+    print(f'Converted {n} terms.')
+    if n == 0:
+        return
+    p.write_text(new_text, encoding='utf-8', newline='')
+
+
+if __name__ == '__main__':
+    main()
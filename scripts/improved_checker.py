@@ -3,13 +3,27 @@
 Improved spell and grammar checker for Aptos book markdown files
 """
 
+import argparse
+import hashlib
+import json
 import re
 import sys
 import os
+from bisect import bisect_right
+from functools import partial
+from itertools import accumulate, chain
 from pathlib import Path
+from types import MappingProxyType
 
-# Comprehensive technical terms and common English words to ignore
-ALLOWED_WORDS = {
+try:
+    import ahocorasick
+except ImportError:  # optional: fall back to the alternation regex
+    ahocorasick = None
+
+# Comprehensive technical terms and common English words to ignore. Not
+# consulted by check_spelling, which only looks for KNOWN_MISSPELLINGS and so
+# never needs to tokenize the text.
+ALLOWED_WORDS = frozenset(map(sys.intern, {
     # Technical terms
     'aptos', 'blockchain', 'cryptocurrency', 'crypto', 'dapp', 'dapps', 
     'sdk', 'api', 'cli', 'json', 'yaml', 'toml', 'typescript', 'javascript',
@@ -34,10 +48,10 @@ ALLOWED_WORDS = {
     'empty', 'demonstrates', 'demonstrated', 'experience', 'thoroughly', 'system',
     'systems', 'currently', 'quickly', 'python', 'style', 'algorithms', 'constructs',
     'efficiently', 'methods', 'slightly', 'frequently', 'highly', 'especiallly'
-}
+}))
 
-# Actual misspellings to catch
-KNOWN_MISSPELLINGS = {
+# Actual misspellings to catch (read-only, so no code path can mutate it)
+KNOWN_MISSPELLINGS = MappingProxyType({sys.intern(word): correction for word, correction in {
     'alot': 'a lot',
     'occurence': 'occurrence',
     'recieve': 'receive',
@@ -54,83 +68,328 @@ KNOWN_MISSPELLINGS = {
     'begining': 'beginning',
     'commited': 'committed',
     'especiallly': 'especially'  # Found in the files
-}
+}.items()})
+
+# Inline markdown constructs whose text is kept by extract_text_from_markdown,
+# combined into a single alternation so each file is scanned once. Code is
+# removed beforehand by _strip_code.
+MD_RE = re.compile(
+    r'(?P<img>!\[(?P<img_text>[^\]]*)\]\([^)]*\))'
+    r'|(?P<link>\[(?P<link_text>[^\]]*)\]\([^)]*\))'
+    r'|(?P<bold>\*\*(?P<bold_text>[^*]+)\*\*)'
+    r'|(?P<em>\*(?P<em_text>[^*]+)\*)'
+    r'|(?P<ubold>__(?P<ubold_text>[^_]+)__)'
+    r'|(?P<uem>_(?P<uem_text>[^_]+)_)'
+)
+
+# Heading markers are removed in their own pass first: emphasis can span
+# lines, and matched in the same pass it would swallow a heading's '#'
+_HEADING_RE = re.compile(r'^#+\s*', re.MULTILINE)
+
+def _dispatch(match):
+    """Replace a single markdown construct matched by MD_RE."""
+    # Strip constructs nested in the kept text, e.g. a link inside **bold**
+    return MD_RE.sub(_dispatch, match.group(f'{match.lastgroup}_text'))
+
+def _strip_spans(content, marker):
+    """Remove marker-delimited spans with a linear scan (no regex backtracking)."""
+    out = []
+    i = 0
+    while True:
+        start = content.find(marker, i)
+        if start < 0:
+            out.append(content[i:])
+            break
+        out.append(content[i:start])
+        end = content.find(marker, start + len(marker))
+        if end < 0:
+            # Unclosed span: leave the rest untouched, as the regexes did
+            out.append(content[start:])
+            break
+        i = end + len(marker)
+    return ''.join(out)
+
+def _strip_fences(content):
+    """Remove ``` fenced code blocks."""
+    return _strip_spans(content, '```')
+
+def _strip_code(content):
+    """Remove fenced code blocks and `inline code` spans."""
+    return _strip_spans(_strip_fences(content), '`')
 
 def extract_text_from_markdown(content):
     """Extract plain text from markdown, excluding code blocks and links."""
-    # Remove code blocks
-    content = re.sub(r'```.*?```', '', content, flags=re.DOTALL)
-    content = re.sub(r'`[^`]*`', '', content)
-    
-    # Remove links but keep link text
-    content = re.sub(r'\[([^\]]*)\]\([^)]*\)', r'\1', content)
-    content = re.sub(r'!\[([^\]]*)\]\([^)]*\)', r'\1', content)
-    
-    # Remove markdown formatting
-    content = re.sub(r'^#+\s*', '', content, flags=re.MULTILINE)
-    content = re.sub(r'\*\*([^*]+)\*\*', r'\1', content)
-    content = re.sub(r'\*([^*]+)\*', r'\1', content)
-    content = re.sub(r'__([^_]+)__', r'\1', content)
-    content = re.sub(r'_([^_]+)_', r'\1', content)
+    text = MD_RE.sub(_dispatch, _HEADING_RE.sub('', _strip_code(content)))
+    # A link wrapping an image, [![alt](img)](url), leaves an image behind
+    if '](' in text:
+        text = MD_RE.sub(_dispatch, text)
+    return text
+
+# Matches any known misspelling as a whole word; longest alternatives first.
+# Underscores count as boundaries so `_word_` emphasis in raw markdown matches.
+# The Aho-Corasick automaton below is the linear-time path. Case folding is
+# ASCII-only (the scoped `ai` flags) so every match lowercases back to a
+# KNOWN_MISSPELLINGS key; full Unicode folding would let e.g. U+017F 'ſ'
+# match 's'. The word boundaries stay Unicode-aware.
+_MISS_RE = re.compile(
+    r'(?<![^\W_])((?ai:' + '|'.join(map(re.escape, sorted(KNOWN_MISSPELLINGS, key=len, reverse=True))) + r'))(?![^\W_])'
+)
+
+def _build_automaton():
+    """Build an Aho-Corasick automaton over KNOWN_MISSPELLINGS, if available."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for word, correction in KNOWN_MISSPELLINGS.items():
+        automaton.add_word(word, (word, correction))
+    automaton.make_automaton()
+    return automaton
+
+_MISS_AUTOMATON = _build_automaton()
+
+def _is_word_char(char):
+    return char.isalnum()
+
+def _iter_misspellings(text, lowered=False):
+    """Yield (position, word) for each known misspelling in text.
+
+    Pass lowered=True when text is already lowercase to skip the copy the
+    automaton path otherwise makes.
+    """
+    if _MISS_AUTOMATON is None:
+        for match in _MISS_RE.finditer(text):
+            yield match.start(), match.group(0).lower()
+        return
     
-    return content
+    # The automaton is case-sensitive, so this path needs lowercase text
+    lowered = text if lowered else text.lower()
+    for end, (word, correction) in _MISS_AUTOMATON.iter(lowered):
+        # The automaton matches substrings; only keep whole words
+        start = end - len(word) + 1
+        if start > 0 and _is_word_char(lowered[start - 1]):
+            continue
+        if end + 1 < len(lowered) and _is_word_char(lowered[end + 1]):
+            continue
+        yield start, word
+
+def check_spelling_batch(texts):
+    """Check several texts with a single scan, returning errors per text."""
+    lowered = _MISS_AUTOMATON is not None
+    if lowered:
+        # Lowercasing can change lengths, so measure offsets on the
+        # lowercased texts the automaton actually scans
+        texts = [text.lower() for text in texts]
+    # ends[i] is one past the separator that follows texts[i]
+    ends = list(accumulate(len(text) + 1 for text in texts))
+    hits = [{} for _ in texts]
+    for position, word in _iter_misspellings('\x01'.join(texts), lowered):
+        hits[bisect_right(ends, position)][word] = KNOWN_MISSPELLINGS[word]
+    return [list(found.items()) for found in hits]
 
 def check_spelling(text):
     """Check text for actual spelling errors."""
-    words = re.findall(r'\b[A-Za-z]+\b', text.lower())
-    spelling_errors = []
-    
-    for word in set(words):  # Use set to avoid duplicates
-        if word in KNOWN_MISSPELLINGS:
-            spelling_errors.append((word, KNOWN_MISSPELLINGS[word]))
-    
-    return spelling_errors
+    return check_spelling_batch([text])[0]
+
+# Common grammar mistakes, one named group per mistake so a single pattern
+# covers them all. Each mistake starts with a different word, so at most one
+# group can match at any position. The gaps are bounded: an unbounded `.*`
+# backtracks quadratically on long lines such as markdown tables.
+_GRAMMAR_RE = re.compile(
+    r"(?P<its>\bit's own\b)"
+    r"|(?P<alot>\balot\b)"
+    r"|(?P<loose>\bloose\b[^\n]{0,60}\b(?:something|it|them)\b)"
+    r"|(?P<then>\bthen\b[^\n]{0,60}\b(?:better|more|less)\b)",
+    re.IGNORECASE,
+)
+
+# Group name -> (suggestion, explanation), in reporting order
+_GRAMMAR_FIXES = {
+    'its': ("its own", "Possessive 'its' doesn't use an apostrophe"),
+    'alot': ("a lot", "Should be two words"),
+    'loose': ("lose", "Use 'lose' not 'loose' for the verb"),
+    'then': ("than", "Use 'than' for comparisons"),
+}
+
+_PASSIVE_RE = re.compile(r'\b(is|are|was|were|be|been|being)\s+\w*ed\b', re.IGNORECASE)
+
+# Cheap byte-level prefilter: files without any of these substrings cannot
+# produce spelling errors or pattern-based grammar issues
+_TRIGGER_RE = re.compile(
+    rb'(?i)' + b'|'.join(
+        [re.escape(word.encode()) for word in KNOWN_MISSPELLINGS]
+        + [rb"it's own", rb'loose', rb'then']
+    )
+)
+
+def check_passive_voice(content):
+    """Flag files that overuse the passive voice."""
+    passive_patterns = _PASSIVE_RE.findall(content)
+    if len(passive_patterns) > 20:  # Raised threshold
+        return [('High passive voice', f'{len(passive_patterns)} instances', 'Consider using more active voice')]
+    return []
 
 def check_grammar(content):
     """Check for common grammar issues."""
     issues = []
     
-    # Check for common mistakes
-    patterns = [
-        (r"\bit's own\b", "its own", "Possessive 'its' doesn't use an apostrophe"),
-        (r"\balot\b", "a lot", "Should be two words"),
-        (r"\bloose\b.*\b(something|it|them)\b", "lose", "Use 'lose' not 'loose' for the verb"),
-        (r"\bthen\b.*\b(better|more|less)\b", "than", "Use 'than' for comparisons"),
-    ]
-    
-    for pattern, suggestion, explanation in patterns:
-        matches = re.finditer(pattern, content, re.IGNORECASE)
-        for match in matches:
-            issues.append((match.group(), suggestion, explanation))
-    
-    # Check for passive voice overuse (more conservative threshold)
-    passive_patterns = re.findall(r'\b(is|are|was|were|be|been|being)\s+\w*ed\b', content, re.IGNORECASE)
-    if len(passive_patterns) > 20:  # Raised threshold
-        issues.append(('High passive voice', f'{len(passive_patterns)} instances', 'Consider using more active voice'))
+    # Check for common mistakes. Searching again just past each hit's start
+    # (rather than finditer, which resumes at its end) lets hits of different
+    # mistakes overlap, e.g. "alot" inside a "then ... more" span; hits of
+    # the same mistake stay non-overlapping, as with one scan per mistake.
+    hits = {kind: [] for kind in _GRAMMAR_FIXES}
+    ends = {}
+    pos = 0
+    while True:
+        match = _GRAMMAR_RE.search(content, pos)
+        if match is None:
+            break
+        kind = match.lastgroup
+        if match.start() >= ends.get(kind, 0):
+            ends[kind] = match.end()
+            hits[kind].append(match.group())
+        pos = match.start() + 1
+    
+    for kind, (suggestion, explanation) in _GRAMMAR_FIXES.items():
+        for text in hits[kind]:
+            issues.append((text, suggestion, explanation))
+    
+    # Check for passive voice overuse
+    issues.extend(check_passive_voice(content))
     
     return issues
 
-def check_file(file_path):
-    """Check a single markdown file."""
+def _read_file(file_path, strict):
+    """Read a file, returning (content, text to spell check or None)."""
+    raw = file_path.read_bytes()
+    content = raw.decode('utf-8', errors='replace')
+    
+    # Nothing to find: skip the spelling and per-pattern grammar scans
+    if _TRIGGER_RE.search(raw) is None:
+        return content, None
+    
+    if strict:
+        return content, extract_text_from_markdown(content)
+    return content, _strip_code(content)
+
+def check_files(file_paths, strict=False):
+    """Check a batch of markdown files.
+
+    Returns (path, spelling, grammar, error) per file, where error is a
+    message for the report if the file could not be checked. Spelling is
+    checked on the content minus fenced and inline code; with strict, all
+    markdown formatting is stripped first. The text of the whole batch is
+    scanned for misspellings in one pass.
+    """
+    read = []
+    errors = {}
+    for file_path in file_paths:
+        try:
+            read.append(_read_file(file_path, strict))
+        except Exception as e:
+            errors[file_path] = f"Error reading {file_path}: {e}"
+            read.append(None)
+    
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        text = extract_text_from_markdown(content)
-        spelling_errors = check_spelling(text)
-        grammar_issues = check_grammar(content)
-        
-        return spelling_errors, grammar_issues
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return [], []
+        spelling = iter(check_spelling_batch([r[1] for r in read if r and r[1] is not None]))
+    except Exception:
+        # Spell check file by file below so a failure is reported per file
+        spelling = None
+    
+    results = []
+    for file_path, entry in zip(file_paths, read):
+        if entry is None:
+            results.append((file_path, [], [], errors[file_path]))
+            continue
+        content, text = entry
+        try:
+            if text is None:
+                results.append((file_path, [], check_passive_voice(content), None))
+            else:
+                spelling_errors = next(spelling) if spelling is not None else check_spelling(text)
+                results.append((file_path, spelling_errors, check_grammar(content), None))
+        except Exception as e:
+            results.append((file_path, [], [], f"Error checking {file_path}: {e}"))
+    return results
+
+def check_file(file_path, strict=False):
+    """Check a single markdown file, returning (path, spelling, grammar, error)."""
+    return check_files([file_path], strict)[0]
+
+# Directories that never contain book sources
+SKIP_DIRS = {'.git', 'node_modules', 'target', 'build'}
+
+def find_markdown_files(root):
+    """Yield markdown files under root, without descending into SKIP_DIRS."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for filename in filenames:
+            if filename.endswith('.md'):
+                yield Path(dirpath) / filename
+
+# Files per check_files call, and the amount of stale markdown below which
+# checking in-process beats starting a process pool
+BATCH_SIZE = 8
+POOL_MIN_BYTES = 2 * 1024 * 1024
+
+# Results of previous runs, keyed by path and invalidated by size/mtime.
+# The whole cache is dropped when this script (word lists, patterns, logic)
+# or the optional matcher changes.
+CACHE_PATH = Path('.checker-cache.json')
+CHECKER_DIGEST = hashlib.sha256(
+    Path(__file__).read_bytes()
+    + f'ahocorasick:{_MISS_AUTOMATON is not None}'.encode()
+).hexdigest()
+
+def load_cache(path, strict):
+    """Load cached check results, or an empty cache if unusable."""
+    try:
+        data = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('checker') != CHECKER_DIGEST:
+        return {}
+    if data.get('strict') != strict:
+        return {}
+    files = data.get('files', {})
+    if not isinstance(files, dict) or not all(map(_valid_cache_entry, files.values())):
+        return {}
+    return files
+
+def _valid_cache_entry(entry):
+    """Whether entry has the shape save_cache writes."""
+    def rows(value, width):
+        return isinstance(value, list) and all(
+            isinstance(row, list) and len(row) == width and all(isinstance(item, str) for item in row)
+            for row in value
+        )
+    return (
+        isinstance(entry, dict)
+        and isinstance(entry.get('stamp'), list)
+        and rows(entry.get('spelling'), 2)
+        and rows(entry.get('grammar'), 3)
+    )
+
+def save_cache(path, entries, strict):
+    """Write check results for the next run."""
+    data = {'checker': CHECKER_DIGEST, 'strict': strict, 'files': entries}
+    try:
+        path.write_text(json.dumps(data, separators=(',', ':')), encoding='utf-8')
+    except OSError as e:
+        print(f"Error writing {path}: {e}", file=sys.stderr)
 
 def main():
     """Main function to check all markdown files."""
-    print("🔍 Aptos Book Spell & Grammar Checker")
-    print("=" * 50)
+    parser = argparse.ArgumentParser(description="Spell and grammar check the book's markdown files.")
+    parser.add_argument("--strict", action="store_true",
+                        help="Strip links and emphasis too before spell checking (slower)")
+    args = parser.parse_args()
+    
+    # Output is collected and written once at the end
+    buf = []
+    buf.append("🔍 Aptos Book Spell & Grammar Checker\n")
+    buf.append("=" * 50 + "\n")
     
-    md_files = list(Path('.').glob('**/*.md'))
+    md_files = sorted(find_markdown_files('.'))
     total_files = len(md_files)
     files_with_issues = 0
     total_spelling_errors = 0
@@ -138,8 +397,62 @@ def main():
     
     all_issues = []
     
+    # Reuse results for files unchanged since the last run
+    cache = load_cache(CACHE_PATH, args.strict)
+    new_cache = {}
+    results = {}
+    stamps = {}
+    stale = []
+    for file_path in md_files:
+        try:
+            st = file_path.stat()
+        except OSError:
+            stale.append(file_path)
+            continue
+        stamp = [st.st_size, st.st_mtime_ns]
+        entry = cache.get(str(file_path))
+        if entry and entry.get('stamp') == stamp:
+            results[file_path] = (
+                [tuple(error) for error in entry['spelling']],
+                [tuple(issue) for issue in entry['grammar']],
+                None,
+            )
+            new_cache[str(file_path)] = entry
+        else:
+            stamps[file_path] = stamp
+            stale.append(file_path)
+    
+    # Files are independent and the work is regex-bound, so large runs fan
+    # out across processes, a batch of files per task. Starting a pool costs
+    # more than checking this book's ~130 files, so small runs stay in-process.
+    batches = [stale[i:i + BATCH_SIZE] for i in range(0, len(stale), BATCH_SIZE)]
+    stale_bytes = sum(stamps[file_path][0] for file_path in stale if file_path in stamps)
+    check_batch = partial(check_files, strict=args.strict)
+    if len(batches) > 1 and stale_bytes > POOL_MIN_BYTES and (os.cpu_count() or 1) > 1:
+        # Imported here: concurrent.futures alone costs a noticeable share of
+        # a small run's startup
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor() as executor:
+            checked = list(chain.from_iterable(executor.map(check_batch, batches)))
+    else:
+        checked = list(chain.from_iterable(map(check_batch, batches)))
+    
+    for file_path, spelling_errors, grammar_issues, error in checked:
+        results[file_path] = (spelling_errors, grammar_issues, error)
+        # Don't cache failures; the next run should retry them
+        if error is None and file_path in stamps:
+            new_cache[str(file_path)] = {
+                'stamp': stamps[file_path],
+                'spelling': spelling_errors,
+                'grammar': grammar_issues,
+            }
+    
+    save_cache(CACHE_PATH, new_cache, args.strict)
+    
     for file_path in md_files:
-        spelling_errors, grammar_issues = check_file(file_path)
+        spelling_errors, grammar_issues, error = results[file_path]
+        if error is not None:
+            buf.append(f"{error}\n")
         
         if spelling_errors or grammar_issues:
             files_with_issues += 1
@@ -150,49 +463,51 @@ def main():
             }
             all_issues.append(file_issues)
             
-            print(f"\n⚠️  {file_path}")
+            buf.append(f"\n⚠️  {file_path}\n")
             
             if spelling_errors:
-                print("  🔤 Spelling Issues:")
+                buf.append("  🔤 Spelling Issues:\n")
                 for word, suggestion in spelling_errors:
-                    print(f"    • '{word}' → '{suggestion}'")
+                    buf.append(f"    • '{word}' → '{suggestion}'\n")
                 total_spelling_errors += len(spelling_errors)
             
             if grammar_issues:
-                print("  📝 Grammar Issues:")
+                buf.append("  📝 Grammar Issues:\n")
                 for issue, suggestion, explanation in grammar_issues:
-                    print(f"    • {issue} → {suggestion} ({explanation})")
+                    buf.append(f"    • {issue} → {suggestion} ({explanation})\n")
                 total_grammar_issues += len(grammar_issues)
         else:
-            print(f"✅ {file_path}")
+            buf.append(f"✅ {file_path}\n")
     
     # Summary
-    print("\n" + "=" * 50)
-    print("📊 SUMMARY")
-    print(f"Total files checked: {total_files}")
-    print(f"Files with issues: {files_with_issues}")
-    print(f"Files without issues: {total_files - files_with_issues}")
-    print(f"Actual spelling errors: {total_spelling_errors}")
-    print(f"Grammar concerns: {total_grammar_issues}")
+    buf.append("\n" + "=" * 50 + "\n")
+    buf.append("📊 SUMMARY\n")
+    buf.append(f"Total files checked: {total_files}\n")
+    buf.append(f"Files with issues: {files_with_issues}\n")
+    buf.append(f"Files without issues: {total_files - files_with_issues}\n")
+    buf.append(f"Actual spelling errors: {total_spelling_errors}\n")
+    buf.append(f"Grammar concerns: {total_grammar_issues}\n")
     
     # Detailed issues summary
     if files_with_issues > 0:
-        print(f"\n📋 DETAILED ISSUES SUMMARY")
+        buf.append(f"\n📋 DETAILED ISSUES SUMMARY\n")
         for issue in all_issues:
-            print(f"\n{issue['file']}:")
+            buf.append(f"\n{issue['file']}:\n")
             if issue['spelling']:
-                print("  Spelling:")
+                buf.append("  Spelling:\n")
                 for word, correction in issue['spelling']:
-                    print(f"    - {word} → {correction}")
+                    buf.append(f"    - {word} → {correction}\n")
             if issue['grammar']:
-                print("  Grammar:")
+                buf.append("  Grammar:\n")
                 for problem, suggestion, explanation in issue['grammar']:
-                    print(f"    - {problem} ({explanation})")
+                    buf.append(f"    - {problem} ({explanation})\n")
     
     if files_with_issues == 0:
-        print("\n🎉 All files look good!")
+        buf.append("\n🎉 All files look good!\n")
     else:
-        print(f"\n⚠️  {files_with_issues} files need attention.")
+        buf.append(f"\n⚠️  {files_with_issues} files need attention.\n")
+    
+    sys.stdout.write(''.join(buf))
 
 if __name__ == '__main__':
     main()